@@ -1,11 +1,57 @@
 #!/usr/bin/env python3
-import os, sys, time
+import os, sys, time, json, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+import orjson
 import requests
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml C binding
+except ImportError:
+    from yaml import SafeLoader
 
 API = "https://api.trello.com/1"
+CARD_FIELDS = "name,idLabels,due,closed,idList,dueComplete"
+ARCHIVED_CARD_FIELDS = "name,idLabels,due"  # all the recovery loop reads (id is always returned)
+TIMEOUT = (5, 30)  # (connect, read) seconds
+
+# Retries live in the pool: 429/5xx and connection errors back off with jitter,
+# honoring Retry-After. Card PUTs resend the same fields, so they're safe to repeat.
+RETRY = Retry(total=6, backoff_factor=0.5, backoff_max=30, backoff_jitter=0.3,
+              status_forcelist=(429, 500, 502, 503, 504),
+              allowed_methods=frozenset(["GET", "PUT"]),
+              respect_retry_after_header=True, raise_on_status=False)
+
+# One pooled session: keep-alive reuses the TLS connection across calls
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=RETRY))
+
+class TokenBucket:
+    """Client-side pacing under Trello's ~100 requests / 10s per-token limit"""
+    def __init__(self, rate=9, capacity=10):
+        self.rate, self.capacity = rate, capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        # sleep while holding the lock so concurrent callers queue up in order
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.stamp = time.monotonic()
+                self.tokens = 1
+            self.tokens -= 1
+
+# any 10s window sees at most capacity + 10*rate = 100 requests
+BUCKET = TokenBucket(rate=9, capacity=10)
 
 # --- Secrets ---
 KEY   = (os.environ.get("TRELLO_API_KEY")  or os.environ.get("TRELLO_KEY")  or "").strip()
@@ -13,78 +59,143 @@ TOKEN = (os.environ.get("TRELLO_API_TOKEN") or os.environ.get("TRELLO_TOKEN") or
 if not KEY or not TOKEN:
     print("Missing Trello creds: set TRELLO_API_KEY/TRELLO_API_TOKEN (or TRELLO_KEY/TRELLO_TOKEN).", file=sys.stderr)
     sys.exit(1)
+SESSION.params = {"key": KEY, "token": TOKEN}  # merged into every request
 
 # --- Wiring ---
 BOARD_ID = os.environ.get("TRELLO_BOARD_ID")
 LIST_ID  = os.environ.get("TRELLO_LIST_ID")
 CFG_PATH = os.environ.get("CONFIG_PATH", "config.yml")
 VERBOSE  = os.environ.get("VERBOSE", "0") == "1"
+WORKERS  = 8   # max card PUTs in flight at once
+CACHE_DIR = os.path.expanduser(os.environ.get("CACHE_DIR", "~/.cache/trello-timers"))
+CACHE_TTL = int(os.environ.get("CACHE_TTL", "3600"))  # seconds; 0 disables the cache
+
+def load_config(path):
+    """Parse the YAML config, reusing a JSON sidecar while it's newer than the YAML"""
+    cache = path + ".cache.json"
+    try:
+        if os.stat(cache).st_mtime >= os.stat(path).st_mtime:
+            with open(cache, "rb") as f:
+                return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        pass
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = yaml.load(f, Loader=SafeLoader)
+    try:
+        with open(cache, "wb") as f:
+            f.write(orjson.dumps(cfg))
+    except (OSError, TypeError):
+        pass  # read-only checkout, or values JSON can't hold: just parse YAML next time
+    return cfg
 
-with open(CFG_PATH, "r", encoding="utf-8") as f:
-    CFG = yaml.safe_load(f)
+CFG = load_config(CFG_PATH)
 
-TZ = ZoneInfo(CFG.get("timezone", "Europe/Bucharest"))
+TZ  = ZoneInfo(CFG.get("timezone", "Europe/Bucharest"))
+UTC = ZoneInfo("UTC")
 
 def log(*a):
     if VERBOSE: print(*a)
 
-def trello(method, path, **kwargs):
-    params = kwargs.pop("params", {})
-    params.update({"key": KEY, "token": TOKEN})
-    r = requests.request(method, f"{API}{path}", params=params, **kwargs)
-    if r.status_code == 429:
-        time.sleep(1.0)
-        r = requests.request(method, f"{API}{path}", params=params, **kwargs)
+def trello(method, path, conditional=False, **kwargs):
+    """Call the Trello API; conditional=True revalidates the disk-cached body for path via ETag"""
+    kwargs.setdefault("timeout", TIMEOUT)
+    entry = _cache_entry(path) if conditional else None
+    if entry and entry.get("etag"):
+        kwargs["headers"] = {**kwargs.get("headers", {}), "If-None-Match": entry["etag"]}
+    BUCKET.take()
+    r = SESSION.request(method, f"{API}{path}", **kwargs)
+    if entry and r.status_code == 304:
+        _cache_put(path, entry)  # rewrite to restart the TTL on the revalidated body
+        return entry["body"]
     r.raise_for_status()
     if r.headers.get("Content-Type","").startswith("application/json"):
-        return r.json()
-    return r.text
+        body = orjson.loads(r.content)
+    else:
+        body = r.text
+    if conditional:
+        _cache_put(path, {"etag": r.headers.get("ETag"), "body": body})
+    return body
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+def _cache_get(key, ttl=CACHE_TTL):
+    if ttl <= 0:
+        return None
+    path = _cache_path(key)
+    try:
+        if time.time() - os.stat(path).st_mtime >= ttl:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _cache_put(key, val):
+    # best effort: a read-only or missing cache dir must not fail the run
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_cache_path(key), "w", encoding="utf-8") as f:
+            json.dump(val, f)
+    except OSError as e:
+        log(f"cache write failed → {key}: {e}")
+
+def _cache_entry(key, ttl=float("inf")):
+    # {"etag": ..., "body": ...} as written by trello(conditional=True); anything else is a miss
+    val = _cache_get(key, ttl)
+    return val if isinstance(val, dict) and "body" in val else None
+
+def cached_get(path, ttl=CACHE_TTL):
+    """GET a rarely-changing resource: served from disk while fresh, then revalidated by ETag"""
+    entry = _cache_entry(path, ttl)
+    if entry is not None:
+        return entry["body"]
+    return trello("GET", path, conditional=True)
 
 def find_list_id():
     if LIST_ID: return LIST_ID
     if not BOARD_ID: raise SystemExit("Provide TRELLO_LIST_ID or TRELLO_BOARD_ID env var.")
-    for lst in trello("GET", f"/boards/{BOARD_ID}/lists"):
+    for lst in cached_get(f"/boards/{BOARD_ID}/lists"):
         if lst["name"] == CFG.get("list_name","Daily Log"):
             return lst["id"]
     raise SystemExit("List not found by name on BOARD_ID.")
 
-def board_label_maps(board_id):
-    labels = trello("GET", f"/boards/{board_id}/labels")
+def route(path, **params):
+    # urlencode escapes the commas inside values, so routes can be comma-joined for /batch
+    return f"{path}?{urlencode(params)}" if params else path
+
+def trello_batch(routes):
+    """GET up to 10 routes in one round-trip; bodies come back in request order"""
+    bodies = []
+    for rt, res in zip(routes, trello("GET", "/batch", params={"urls": ",".join(routes)})):
+        if "200" not in res:
+            raise requests.HTTPError(f"batch GET {rt} failed: {res}")
+        bodies.append(res["200"])
+    return bodies
+
+def board_label_maps(labels):
     id_to_name = {lbl["id"]: (lbl.get("name") or "").lower() for lbl in labels}
     return id_to_name
 
-def board_cards(board_id, filter_mode="closed"):
-    return trello("GET", f"/boards/{board_id}/cards",
-                  params={"fields":"name,idLabels,due,closed,idList,dueComplete",
-                          "filter": filter_mode})
+def board_cards_route(board_id, filter_mode="closed", fields=CARD_FIELDS):
+    return route(f"/boards/{board_id}/cards", fields=fields, filter=filter_mode)
 
-def list_cards(list_id):
-    return trello("GET", f"/lists/{list_id}/cards",
-                  params={"fields":"name,idLabels,due,closed,idList,dueComplete","filter":"open"})
+def list_cards_route(list_id):
+    return route(f"/lists/{list_id}/cards", fields=CARD_FIELDS, filter="open")
 
 def parse_due_utc(due):
     if not due: return None
-    base = due.replace("Z","").split(".")[0]
-    return datetime.fromisoformat(base).replace(tzinfo=ZoneInfo("UTC"))
+    return datetime.fromisoformat(due.replace("Z", "+00:00"))
 
-def next_due_utc(days: int, hour: str) -> str:
-    hh, mm = [int(x) for x in hour.split(":")]
-    d = (datetime.now(TZ).date() + timedelta(days=days))
+def next_due_utc(days: int, hh: int, mm: int, today: date) -> str:
+    d = today + timedelta(days=days)
     dt_local = datetime(d.year, d.month, d.day, hh, mm, tzinfo=TZ)
-    return dt_local.astimezone(ZoneInfo("UTC")).strftime("%Y-%m-%dT%H:%M:%S.000Z")
-
-def set_card_closed(card_id, closed: bool):
-    trello("PUT", f"/cards/{card_id}", params={"closed": str(closed).lower()})
+    return dt_local.astimezone(UTC).isoformat(timespec="milliseconds").replace("+00:00", "Z")
 
-def move_card_to_list(card_id, list_id):
-    trello("PUT", f"/cards/{card_id}", params={"idList": list_id})
-
-def set_due_complete(card_id, completed: bool):
-    trello("PUT", f"/cards/{card_id}", params={"dueComplete": str(completed).lower()})
-
-def set_due_and_uncomplete(card_id, due_iso):
-    # critical: set due and dueComplete=false IN THE SAME REQUEST
-    trello("PUT", f"/cards/{card_id}", params={"due": due_iso, "dueComplete": "false"})
+def update_card(card_id, **fields):
+    """Set several card fields in one PUT (bools go over the wire as true/false)"""
+    return trello("PUT", f"/cards/{card_id}",
+                  params={k: (str(v).lower() if isinstance(v, bool) else v) for k, v in fields.items()})
 
 def is_card_overdue(due_utc, now_utc):
     """Check if a card is actually overdue (past its due date)"""
@@ -94,16 +205,29 @@ def is_card_overdue(due_utc, now_utc):
 
 def main():
     list_id = find_list_id()
-    lst = trello("GET", f"/lists/{list_id}")
-    board_id = lst["idBoard"]
-    id_to_name = board_label_maps(board_id)
+    # a list found by name on BOARD_ID needs no lookup to learn its board
+    board_id = BOARD_ID if not LIST_ID else cached_get(f"/lists/{list_id}")["idBoard"]
+
+    # card reads share one /batch round-trip; labels revalidate by ETag alongside it
+    # (/batch drops response headers, so a conditional GET can't ride inside it)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        fut_labels = ex.submit(cached_get, f"/boards/{board_id}/labels")
+        archived, dl_cards = trello_batch([board_cards_route(board_id, "closed", fields=ARCHIVED_CARD_FIELDS),
+                                           list_cards_route(list_id)])
+        id_to_name = board_label_maps(fut_labels.result())
 
     timer_label = CFG["labels"]["timer"].lower()
     cadences = {k.lower(): int(v["days"]) for k,v in CFG.get("cadences", {}).items()}
     timer_hour = CFG.get("defaults", {}).get("timer_hour","03:00")
+    hh, mm = map(int, timer_hour.split(":"))
+    today_local = datetime.now(TZ).date()  # one "today" for the whole run
+
+    # label names are lowercased once in board_label_maps; match cards by label id from here on
+    timer_label_ids = {lid for lid,n in id_to_name.items() if n == timer_label}
+    cadence_label_ids = {lid: cadences[n] for lid,n in id_to_name.items() if n in cadences}
 
     recovered = bumped = reset_due = cleaned = skipped = 0
-    now_utc = datetime.now(ZoneInfo("UTC"))
+    now_utc = datetime.now(UTC)
 
     # 1) recover only overdue archived timer cards
     print(f"DEBUG: Current time (UTC): {now_utc}")
@@ -111,13 +235,15 @@ def main():
     print(f"DEBUG: Available cadences: {cadences}")
     
     archived_timer_cards = []
-    for c in board_cards(board_id, filter_mode="closed"):
-        labels = [id_to_name.get(lid,"").lower() for lid in c.get("idLabels",[])]
-        if timer_label not in labels:
+    id_to_name_get = id_to_name.get
+    for c in archived:
+        lids = c.get("idLabels") or ()
+        if timer_label_ids.isdisjoint(lids):  # stops at the first timer label id
             continue
         
-        cadence_days = next((cadences[l] for l in labels if l in cadences), None)
+        cadence_days = next((cadence_label_ids[l] for l in lids if l in cadence_label_ids), None)
         if not cadence_days:
+            labels = [id_to_name_get(l, "") for l in lids]
             print(f"DEBUG: No cadence found for '{c['name']}' with labels: {labels}")
             continue
 
@@ -140,41 +266,53 @@ def main():
 
     print(f"DEBUG: Found {len(archived_timer_cards)} archived timer cards")
     
-    # Now process only the overdue ones
+    # Now queue a revive for the overdue ones; writes are applied together in step 3
+    updates = []  # (kind, card, fields) → one PUT /cards/{id} each
     for item in archived_timer_cards:
         c = item['card']
         due_utc = item['due_utc']
-        is_overdue = item['is_overdue']
-        cadence_days = item['cadence_days']
-        
-        if not is_overdue:
+
+        if not item['is_overdue']:
             print(f"SKIP (not due yet) → '{c['name']}' due: {due_utc}")
             skipped += 1
             continue
 
         print(f"UNARCHIVE (overdue) → '{c['name']}' was due: {due_utc}")
-        set_card_closed(c["id"], False)
-        move_card_to_list(c["id"], list_id)
-        recovered += 1
-
-        # set new due AND mark incomplete atomically
-        new_due = next_due_utc(cadence_days, timer_hour)
-        set_due_and_uncomplete(c["id"], new_due)
-        bumped += 1
-        reset_due += 1
-        print(f"bumped + dueComplete=false → '{c['name']}' → {new_due}")
+        # critical: set due and dueComplete=false IN THE SAME REQUEST
+        new_due = next_due_utc(item['cadence_days'], hh, mm, today_local)
+        updates.append(("revive", c, {"closed": False, "idList": list_id, "due": new_due, "dueComplete": False}))
 
     # 2) safety: archive legacy clones like "… – 1h" / "... - 1h" that are not timer cards
     suffixes = ("– 1h", "- 1h")
-    for c in list_cards(list_id):
-        if any(c["name"].strip().endswith(s) for s in suffixes):
-            labels = [id_to_name.get(lid,"").lower() for lid in c.get("idLabels",[])]
-            if timer_label not in labels:
-                set_card_closed(c["id"], True)
+    for c in dl_cards:
+        if c["name"].strip().endswith(suffixes):
+            if timer_label_ids.isdisjoint(c.get("idLabels") or ()):
+                updates.append(("clone", c, {"closed": True}))
+
+    # 3) send every PUT concurrently over the pooled session; the token bucket keeps us under quota
+    failed = 0
+    with ThreadPoolExecutor(max_workers=WORKERS) as ex:
+        futures = {ex.submit(update_card, c["id"], **fields): (kind, c, fields) for kind, c, fields in updates}
+        for fut in as_completed(futures):
+            kind, c, fields = futures[fut]
+            try:
+                fut.result()
+            except requests.RequestException as e:
+                print(f"FAILED → '{c['name']}': {e}", file=sys.stderr)
+                failed += 1
+                continue
+            if kind == "revive":
+                recovered += 1
+                bumped += 1
+                reset_due += 1
+                print(f"bumped + dueComplete=false → '{c['name']}' → {fields['due']}")
+            else:
                 cleaned += 1
                 log(f"cleanup clone → '{c['name']}'")
 
-    print(f"Timers OK — recovered:{recovered}, dueReset:{reset_due}, bumped:{bumped}, skipped:{skipped}, cleanedClones:{cleaned}")
+    print(f"Timers OK — recovered:{recovered}, dueReset:{reset_due}, bumped:{bumped}, skipped:{skipped}, cleanedClones:{cleaned}, failed:{failed}")
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()